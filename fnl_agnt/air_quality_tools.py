@@ -1,19 +1,89 @@
 # air_quality_tools.py
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import time
+from concurrent.futures import ThreadPoolExecutor
 from geopy.distance import geodesic
 from datetime import datetime
 from typing import Optional, List, Dict
 
+try:
+    # Parser JSON más rápido para las respuestas de la API (opcional)
+    from orjson import loads as _json_loads
+except ImportError:
+    from json import loads as _json_loads
+
+try:
+    # MessagePack solo se usa si el servidor (o un proxy delante) lo ofrece
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
+# Endpoints de la API de calidad del aire de Cali
+NODES_URL = "https://apioac22.cali.gov.co/nodes"
+METRICS_URL = "https://apioac22.cali.gov.co/metrics/range_public"
+_HEADERS = {
+    'accept': 'application/msgpack, application/json;q=0.9' if _msgpack else 'application/json'
+}
+
+# Número máximo de consultas simultáneas a la API de métricas
+MAX_METRICS_WORKERS = 16
+
+# Sesión compartida: reutiliza conexiones keep-alive en lugar de abrir TCP+TLS por consulta
+_SESSION = requests.Session()
+_SESSION.mount('https://', HTTPAdapter(
+    pool_connections=32,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.2)
+))
+
+# Coeficientes del score de calidad del aire (penalización por µg/m³ y pesos)
+_PM25_K = 2.0
+_PM10_K = 0.5
+_W25 = 0.7
+_W10 = 0.3
+
+# Caché en memoria de la lista de nodos (cambia muy poco entre consultas)
+NODES_CACHE_TTL_S = 300
+_NODES_CACHE = {'t': 0.0, 'data': None}
+
+# Caché de la calidad del aire de todos los nodos (las lecturas cambian cada varios minutos)
+AIR_QUALITY_CACHE_TTL_S = 300
+_AIR_QUALITY_CACHE = {'t': 0.0, 'data': None}
+
+def _decode_response(response):
+    """Decodifica el cuerpo según el content-type negociado (MessagePack o JSON)."""
+    content_type = response.headers.get('content-type', '')
+    if _msgpack is not None and content_type.startswith('application/msgpack'):
+        return _msgpack.unpackb(response.content, raw=False)
+    return _json_loads(response.content)
+
 def get_cali_nodes() -> dict:
     """
     Obtiene todos los nodos de Cali desde la API oficial.
     """
+    return _cached_nodes()
+
+def _cached_nodes(ttl: float = NODES_CACHE_TTL_S) -> dict:
+    """Devuelve los nodos en caché si no han expirado; si no, los descarga de nuevo."""
+    if _NODES_CACHE['data'] is not None and time.monotonic() - _NODES_CACHE['t'] < ttl:
+        return _NODES_CACHE['data']
+    
+    result = _fetch_cali_nodes()
+    # Solo se guardan respuestas exitosas para no fijar errores transitorios
+    if result.get('success'):
+        _NODES_CACHE['t'] = time.monotonic()
+        _NODES_CACHE['data'] = result
+    return result
+
+def _fetch_cali_nodes() -> dict:
+    """Descarga y normaliza la lista de nodos desde la API."""
     try:
-        url = "https://apioac22.cali.gov.co/nodes"
-        response = requests.get(url, headers={'accept': 'application/json'}, timeout=10)
+        response = _SESSION.get(NODES_URL, headers=_HEADERS, timeout=10)
         
         if response.status_code == 200:
-            nodes = response.json()
+            nodes = _decode_response(response)
             normalized = []
             
             for node in nodes:
@@ -46,21 +116,12 @@ def get_air_quality_metrics(deviceId: str, start_date: Optional[str] = None) ->
         if not start_date:
             start_date = datetime.now().strftime("%Y-%m-%d")
         
-        url = "https://apioac22.cali.gov.co/metrics/range_public"
-        params = {
-            'deviceId': deviceId,
-            'start_date': start_date
-        }
-        
-        response = requests.get(
-            url, 
-            params=params,
-            headers={'accept': 'application/json'}, 
-            timeout=10
-        )
+        # deviceId es alfanumérico y la fecha ISO: la URL se arma sin codificar parámetros
+        full_url = f"{METRICS_URL}?deviceId={deviceId}&start_date={start_date}"
+        response = _SESSION.get(full_url, headers=_HEADERS, timeout=10)
         
         if response.status_code == 200:
-            metrics_data = response.json()
+            metrics_data = _decode_response(response)
             
             latest_data = {}
             if metrics_data and len(metrics_data) > 0:
@@ -98,13 +159,17 @@ def calculate_air_quality_score(metrics: dict) -> float:
     Calcula un score de calidad del aire (0-100, donde 100 es mejor).
     """
     try:
-        pm25 = metrics.get('massPM2_5Avg', 0) or 0
-        pm10 = metrics.get('massPM10_0Avg', 0) or 0
+        pm25 = metrics.get('massPM2_5Avg') or 0
+        pm10 = metrics.get('massPM10_0Avg') or 0
         
-        pm25_score = max(0, 100 - (pm25 * 2))
-        pm10_score = max(0, 100 - (pm10 * 0.5))
+        # Sin material particulado el score es el máximo: no hace falta calcular
+        if pm25 == 0 and pm10 == 0:
+            return 100.0
         
-        overall_score = (pm25_score * 0.7) + (pm10_score * 0.3)
+        pm25_score = max(0, 100 - (pm25 * _PM25_K))
+        pm10_score = max(0, 100 - (pm10 * _PM10_K))
+        
+        overall_score = (pm25_score * _W25) + (pm10_score * _W10)
         
         return round(max(0, min(100, overall_score)), 2)
     except:
@@ -114,22 +179,46 @@ def get_air_quality_for_all_nodes() -> dict:
     """
     Obtiene la calidad del aire para todos los nodos que tienen deviceId.
     """
+    return _cached_air_quality()
+
+def _cached_air_quality(ttl: float = AIR_QUALITY_CACHE_TTL_S) -> dict:
+    """Devuelve la calidad del aire en caché si no ha expirado; si no, la consulta de nuevo."""
+    if _AIR_QUALITY_CACHE['data'] is not None and time.monotonic() - _AIR_QUALITY_CACHE['t'] < ttl:
+        return _AIR_QUALITY_CACHE['data']
+    
+    result = _fetch_air_quality_for_all_nodes()
+    # Sin métricas (p. ej. todas las consultas fallaron) no se guarda: se reintenta en la próxima llamada
+    if result.get('success') and result.get('nodes_with_data', 0) > 0:
+        _AIR_QUALITY_CACHE['t'] = time.monotonic()
+        _AIR_QUALITY_CACHE['data'] = result
+    return result
+
+def _fetch_air_quality_for_all_nodes() -> dict:
+    """Consulta las métricas de todos los nodos con deviceId y las une a cada nodo."""
     try:
         nodes_result = get_cali_nodes()
         if not nodes_result.get('success'):
             return nodes_result
         
         nodes = nodes_result['nodes']
-        air_quality_data = []
+        device_nodes = [node for node in nodes if node.get('deviceId')]
+        
+        # Las consultas son independientes y limitadas por red: se lanzan en paralelo
+        try:
+            with ThreadPoolExecutor(max_workers=MAX_METRICS_WORKERS) as executor:
+                results = list(executor.map(
+                    lambda node: (node, get_air_quality_metrics(node['deviceId'])),
+                    device_nodes
+                ))
+        except RuntimeError:
+            # Si no se puede crear el pool, consultar de forma secuencial
+            results = [(node, get_air_quality_metrics(node['deviceId'])) for node in device_nodes]
         
-        for node in nodes:
-            if node.get('deviceId'):
-                metrics_result = get_air_quality_metrics(node['deviceId'])
-                if metrics_result.get('success') and metrics_result.get('metrics'):
-                    air_quality_data.append({
-                        **node,
-                        "air_quality": metrics_result['metrics']
-                    })
+        air_quality_data = [
+            node | {"air_quality": metrics_result['metrics']}
+            for node, metrics_result in results
+            if metrics_result.get('success') and metrics_result.get('metrics')
+        ]
         
         return {
             "success": True,
@@ -1,14 +1,137 @@
 # destination_tools_osm.py
-import osmnx as ox
 import requests
 import json
+import functools
+import logging
+import os
+import threading
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from typing import Dict, List, Optional
 from geopy.distance import geodesic
 
-# Configurar OSM
-ox.settings.log_console = False
-ox.settings.use_cache = True
-ox.settings.timeout = 300
+from .geo_tools import haversine_km
+
+logger = logging.getLogger(__name__)
+
+def _normalize(text: str) -> str:
+    """Minúsculas sin tildes ni diacríticos ("Clínica" -> "clinica") para comparar búsquedas."""
+    return unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode('ascii').lower()
+
+# osmnx (y con él pandas, geopandas, shapely...) se importa solo cuando se necesita
+_ox = None
+_ox_lock = threading.Lock()
+
+def ensure_osm():
+    """Importa y configura osmnx la primera vez que se usa; devuelve el módulo."""
+    global _ox
+    if _ox is None:
+        with _ox_lock:
+            if _ox is None:
+                import osmnx as ox
+                
+                # Configurar OSM
+                ox.settings.log_console = False
+                ox.settings.use_cache = True
+                ox.settings.timeout = 300
+                _ox = ox
+    return _ox
+
+# Bounding box de Cali (norte, sur, este, oeste)
+CALI_LOCATION = "Cali, Colombia"
+CALI_BBOX = (3.55, 3.32, -76.45, -76.58)
+
+# Mapeo de términos de búsqueda a tags OSM
+OSM_TAG_MAPPINGS = [
+    # Hospitales y salud
+    {"hospital": {"amenity": "hospital"}},
+    {"clínica": {"amenity": "clinic"}},
+    {"salud": {"amenity": ["hospital", "clinic", "doctors"]}},
+    {"farmacia": {"amenity": "pharmacy"}},
+    {"medico": {"amenity": "doctors"}},
+    
+    # Educación
+    {"universidad": {"amenity": "university"}},
+    {"colegio": {"amenity": "school"}},
+    {"escuela": {"amenity": "school"}},
+    {"educación": {"amenity": ["university", "college", "school"]}},
+    
+    # Comercio
+    {"centro comercial": {"shop": "mall"}},
+    {"supermercado": {"shop": "supermarket"}},
+    {"tienda": {"shop": True}},
+    {"compras": {"shop": True}},
+    
+    # Comida
+    {"restaurante": {"amenity": "restaurant"}},
+    {"café": {"amenity": "cafe"}},
+    {"comida": {"amenity": ["restaurant", "cafe", "fast_food"]}},
+    
+    # Entretenimiento
+    {"parque": {"leisure": "park"}},
+    {"cine": {"amenity": "cinema"}},
+    {"teatro": {"amenity": "theatre"}},
+    
+    # Transporte
+    {"aeropuerto": {"aeroway": "aerodrome"}},
+    {"estación": {"amenity": ["bus_station", "train_station"]}},
+    {"bus": {"amenity": "bus_station"}},
+    
+    # Servicios
+    {"banco": {"amenity": "bank"}},
+    {"hotel": {"tourism": "hotel"}},
+    {"gasolina": {"amenity": "fuel"}},
+    {"policía": {"amenity": "police"}},
+    {"bomberos": {"amenity": "fire_station"}}
+]
+
+# Índice plano {término: tags} construido una sola vez al importar el módulo
+_TAG_MAP = {_normalize(term): tags for mapping in OSM_TAG_MAPPINGS for term, tags in mapping.items()}
+
+# Base de datos de respaldo para cuando OSM no funciona
+BACKUP_DESTINATIONS = {
+    "hospital": [
+        {"nombre": "Hospital Universitario del Valle", "lat": 3.3759, "lng": -76.5325, "type": "hospital", "address": "Calle 5 # 36-08"},
+        {"nombre": "Clínica Imbanaco", "lat": 3.4205, "lng": -76.5462, "type": "hospital", "address": "Cra. 38 # 5A-100"},
+        {"nombre": "Fundación Valle del Lili", "lat": 3.3686, "lng": -76.5307, "type": "hospital", "address": "Cra. 98 # 18-49"},
+        {"nombre": "Hospital San Juan de Dios", "lat": 3.4512, "lng": -76.5401, "type": "hospital", "address": "Cra. 10 # 1-27"}
+    ],
+    "universidad": [
+        {"nombre": "Universidad del Valle", "lat": 3.3759, "lng": -76.5325, "type": "university", "address": "Ciudad Universitaria Meléndez"},
+        {"nombre": "Universidad Santiago de Cali", "lat": 3.4412, "lng": -76.5456, "type": "university", "address": "Calle 5 # 62-00"},
+        {"nombre": "Universidad Icesi", "lat": 3.3409, "lng": -76.5301, "type": "university", "address": "Cra. 122 # 1-80"},
+        {"nombre": "Universidad Autónoma de Occidente", "lat": 3.4376, "lng": -76.5465, "type": "university", "address": "Cra. 122 # 1-80"}
+    ],
+    "centro comercial": [
+        {"nombre": "Centro Comercial Jardín Plaza", "lat": 3.3689, "lng": -76.5297, "type": "mall", "address": "Cra. 100 # 5-169"},
+        {"nombre": "Centro Comercial Único", "lat": 3.4203, "lng": -76.5468, "type": "mall", "address": "Cra. 38 # 5-01"},
+        {"nombre": "Centro Comercial Chipichape", "lat": 3.4926, "lng": -76.5008, "type": "mall", "address": "Cra. 38 # 53-45"}
+    ],
+    "parque": [
+        {"nombre": "Parque del Perro", "lat": 3.4025, "lng": -76.5456, "type": "park", "address": "Calle 2 Oeste"},
+        {"nombre": "Parque del Gato", "lat": 3.4518, "lng": -76.5321, "type": "park", "address": "Cra. 4 # 10-00"},
+        {"nombre": "Parque de la Caña", "lat": 3.4852, "lng": -76.5051, "type": "park", "address": "Cra. 56 # 3-00"}
+    ],
+    "aeropuerto": [
+        {"nombre": "Aeropuerto Alfonso Bonilla Aragón", "lat": 3.5432, "lng": -76.3815, "type": "airport", "address": "Palmira, Valle del Cauca"}
+    ],
+    "farmacia": [
+        {"nombre": "Farmacia Cruz Verde", "lat": 3.4510, "lng": -76.5320, "type": "pharmacy", "address": "Cra. 4 # 10-25"},
+        {"nombre": "Farmacia Dr. Simi", "lat": 3.4415, "lng": -76.5460, "type": "pharmacy", "address": "Calle 5 # 62-15"}
+    ],
+    "banco": [
+        {"nombre": "Banco de Bogotá", "lat": 3.4515, "lng": -76.5318, "type": "bank", "address": "Cra. 4 # 10-30"},
+        {"nombre": "Bancolombia", "lat": 3.4418, "lng": -76.5458, "type": "bank", "address": "Calle 5 # 62-20"}
+    ]
+}
+
+# Índice plano precalculado: (categoría, lugar, nombre normalizado, palabras del nombre)
+_BACKUP_ENTRIES = [
+    (_normalize(category), place, _normalize(place['nombre']), set(_normalize(place['nombre']).split()))
+    for category, places in BACKUP_DESTINATIONS.items()
+    for place in places
+]
 
 def find_destination_osm(destination_name: str, location: str = "Cali, Colombia", limit: int = 5) -> dict:
     """
@@ -17,8 +140,8 @@ def find_destination_osm(destination_name: str, location: str = "Cali, Colombia"
     try:
         print(f"🔍 Buscando '{destination_name}' en OSM...")
         
-        # 1. Primero intentar con búsqueda por tags de OSM
-        matches = find_destination_by_tags(destination_name, location, limit)
+        # 1. Primero intentar con búsqueda por tags de OSM (con caché por término)
+        matches = cached_destination_by_tags(destination_name, location, limit)
         
         if matches:
             return {
@@ -60,116 +183,127 @@ def find_destination_osm(destination_name: str, location: str = "Cali, Colombia"
             }
         return {"success": False, "error": str(e)}
 
+def cached_destination_by_tags(destination_name: str, location: str = "Cali, Colombia", limit: int = 5) -> List[Dict]:
+    """
+    Versión con caché de find_destination_by_tags, normalizando el término de búsqueda.
+    Devuelve copias nuevas en cada llamada para que el llamador pueda modificarlas.
+    """
+    display_name = destination_name.strip()
+    search_key = _normalize(display_name)
+    try:
+        matches = json.loads(_find_destination_by_tags_cached(search_key, location, limit))
+    except LookupError:
+        return []
+    
+    # La normalización es solo para la clave de la caché: los nombres de respaldo
+    # ("Lugar - ...", ver get_place_name) conservan el término tal como se escribió
+    fallback_suffix = f" - {search_key}"
+    for match in matches:
+        if match['nombre'].endswith(fallback_suffix):
+            match['nombre'] = match['nombre'][:-len(search_key)] + display_name
+    return matches
+
+@functools.lru_cache(maxsize=128)
+def _find_destination_by_tags_cached(destination_name_lower: str, location: str, limit: int) -> str:
+    matches = find_destination_by_tags(destination_name_lower, location, limit)
+    if not matches:
+        # Sin resultados no se guarda en caché: puede ser un fallo transitorio de Overpass
+        raise LookupError(destination_name_lower)
+    return json.dumps(matches)
+
 def find_destination_by_tags(destination_name: str, location: str = "Cali, Colombia", limit: int = 5) -> List[Dict]:
     """
     Busca destinos usando tags específicos de OSM.
     """
     try:
-        destination_name_lower = destination_name.lower()
+        destination_name_lower = _normalize(destination_name)
         matches = []
         
-        # Mapeo de categorías a tags OSM
-        tags_to_try = get_osm_tags_for_search(destination_name_lower)
+        # Mapeo de categorías a tags OSM, combinadas en una sola consulta Overpass
+        tags = merge_osm_tags(get_osm_tags_for_search(destination_name_lower, first_match_only=True))
         
-        for tags in tags_to_try:
-            try:
-                print(f"Buscando con tags: {tags}")
-                
-                # Buscar lugares con estos tags
-                places = ox.geometries_from_place(location, tags)
+        try:
+            logger.debug("Buscando con tags: %s", tags)
+            
+            # Buscar lugares con estos tags
+            places = fetch_osm_features(tags, location)
+            
+            if len(places) > 0:
+                # Acceso por columnas: centroides en un solo cálculo vectorizado
+                subset = places.head(limit * 2)
+                centroids = subset.geometry.centroid
+                lngs = centroids.x.to_numpy()
+                lats = centroids.y.to_numpy()
                 
-                if len(places) > 0:
-                    for idx, place in places.head(limit * 2).iterrows():
-                        try:
-                            name = get_place_name(place, destination_name)
-                            lat = float(place.geometry.centroid.y)
-                            lng = float(place.geometry.centroid.x)
-                            
-                            # Validar coordenadas
-                            if not (-90 <= lat <= 90 and -180 <= lng <= 180):
-                                continue
-                                
-                            matches.append({
-                                "nombre": name,
-                                "lat": lat,
-                                "lng": lng,
-                                "type": get_place_type(place),
-                                "address": get_place_address(place),
-                                "source": "osm_tags"
-                            })
-                            
-                            if len(matches) >= limit * 3:  # Limitar resultados
-                                break
-                                
-                        except Exception as e:
-                            print(f"Error procesando lugar: {e}")
+                for place, lat, lng in zip(subset.to_dict('records'), lats, lngs):
+                    try:
+                        # Validar coordenadas
+                        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
                             continue
                             
-            except Exception as e:
-                print(f"Error buscando con tags {tags}: {e}")
-                continue
+                        matches.append({
+                            "nombre": get_place_name(place, destination_name),
+                            "lat": float(lat),
+                            "lng": float(lng),
+                            "type": get_place_type(place),
+                            "address": get_place_address(place),
+                            "source": "osm_tags"
+                        })
+                        
+                        if len(matches) >= limit:  # Solo se usan los primeros `limit` resultados
+                            break
+                            
+                    except Exception as e:
+                        logger.debug("Error procesando lugar: %s", e)
+                        continue
+                        
+        except Exception as e:
+            logger.warning("Error buscando con tags %s: %s", tags, e)
         
         return matches
         
     except Exception as e:
-        print(f"Error en búsqueda por tags: {e}")
+        logger.warning("Error en búsqueda por tags: %s", e)
         return []
 
-def get_osm_tags_for_search(search_term: str) -> List[Dict]:
+def fetch_osm_features(tags: Dict, location: str = "Cali, Colombia"):
+    """
+    Consulta lugares de OSM con los tags dados.
+    Para Cali usa un bounding box fijo: evita geocodificar el lugar en cada
+    consulta y permite que la caché en disco de osmnx reutilice la respuesta.
+    """
+    ox = ensure_osm()
+    if location == CALI_LOCATION:
+        return ox.features_from_bbox(*CALI_BBOX, tags=tags)
+    return ox.features_from_place(location, tags)
+
+def merge_osm_tags(tags_list: List[Dict]) -> Dict:
+    """Combina varios diccionarios de tags OSM en uno solo (una única consulta)."""
+    merged = {}
+    for tags in tags_list:
+        for key, value in tags.items():
+            if value is True or merged.get(key) is True:
+                merged[key] = True
+                continue
+            values = merged.setdefault(key, [])
+            for item in (value if isinstance(value, list) else [value]):
+                if item not in values:
+                    values.append(item)
+    return merged
+
+def get_osm_tags_for_search(search_term: str, first_match_only: bool = False) -> List[Dict]:
     """
     Genera tags OSM basados en el término de búsqueda.
+    Con first_match_only=True devuelve solo la primera categoría encontrada.
     """
-    search_term = search_term.lower()
-    
-    # Mapeo de términos de búsqueda a tags OSM
-    tag_mappings = [
-        # Hospitales y salud
-        {"hospital": {"amenity": "hospital"}},
-        {"clínica": {"amenity": "clinic"}},
-        {"salud": {"amenity": ["hospital", "clinic", "doctors"]}},
-        {"farmacia": {"amenity": "pharmacy"}},
-        {"medico": {"amenity": "doctors"}},
-        
-        # Educación
-        {"universidad": {"amenity": "university"}},
-        {"colegio": {"amenity": "school"}},
-        {"escuela": {"amenity": "school"}},
-        {"educación": {"amenity": ["university", "college", "school"]}},
-        
-        # Comercio
-        {"centro comercial": {"shop": "mall"}},
-        {"supermercado": {"shop": "supermarket"}},
-        {"tienda": {"shop": True}},
-        {"compras": {"shop": True}},
-        
-        # Comida
-        {"restaurante": {"amenity": "restaurant"}},
-        {"café": {"amenity": "cafe"}},
-        {"comida": {"amenity": ["restaurant", "cafe", "fast_food"]}},
-        
-        # Entretenimiento
-        {"parque": {"leisure": "park"}},
-        {"cine": {"amenity": "cinema"}},
-        {"teatro": {"amenity": "theatre"}},
-        
-        # Transporte
-        {"aeropuerto": {"aeroway": "aerodrome"}},
-        {"estación": {"amenity": ["bus_station", "train_station"]}},
-        {"bus": {"amenity": "bus_station"}},
-        
-        # Servicios
-        {"banco": {"amenity": "bank"}},
-        {"hotel": {"tourism": "hotel"}},
-        {"gasolina": {"amenity": "fuel"}},
-        {"policía": {"amenity": "police"}},
-        {"bomberos": {"amenity": "fire_station"}}
-    ]
+    search_term = _normalize(search_term)
     
-    matching_tags = []
-    for mapping in tag_mappings:
-        for term, tags in mapping.items():
+    if first_match_only:
+        for term, tags in _TAG_MAP.items():
             if term in search_term:
-                matching_tags.append(tags)
+                return [tags]
+    
+    matching_tags = [tags for term, tags in _TAG_MAP.items() if term in search_term]
     
     # Si no hay coincidencias específicas, buscar como amenity general
     if not matching_tags:
@@ -181,66 +315,30 @@ def find_destination_backup(destination_name: str) -> List[Dict]:
     """
     Base de datos de respaldo para cuando OSM no funciona.
     """
-    destination_name_lower = destination_name.lower()
-    
-    destinations_db = {
-        "hospital": [
-            {"nombre": "Hospital Universitario del Valle", "lat": 3.3759, "lng": -76.5325, "type": "hospital", "address": "Calle 5 # 36-08"},
-            {"nombre": "Clínica Imbanaco", "lat": 3.4205, "lng": -76.5462, "type": "hospital", "address": "Cra. 38 # 5A-100"},
-            {"nombre": "Fundación Valle del Lili", "lat": 3.3686, "lng": -76.5307, "type": "hospital", "address": "Cra. 98 # 18-49"},
-            {"nombre": "Hospital San Juan de Dios", "lat": 3.4512, "lng": -76.5401, "type": "hospital", "address": "Cra. 10 # 1-27"}
-        ],
-        "universidad": [
-            {"nombre": "Universidad del Valle", "lat": 3.3759, "lng": -76.5325, "type": "university", "address": "Ciudad Universitaria Meléndez"},
-            {"nombre": "Universidad Santiago de Cali", "lat": 3.4412, "lng": -76.5456, "type": "university", "address": "Calle 5 # 62-00"},
-            {"nombre": "Universidad Icesi", "lat": 3.3409, "lng": -76.5301, "type": "university", "address": "Cra. 122 # 1-80"},
-            {"nombre": "Universidad Autónoma de Occidente", "lat": 3.4376, "lng": -76.5465, "type": "university", "address": "Cra. 122 # 1-80"}
-        ],
-        "centro comercial": [
-            {"nombre": "Centro Comercial Jardín Plaza", "lat": 3.3689, "lng": -76.5297, "type": "mall", "address": "Cra. 100 # 5-169"},
-            {"nombre": "Centro Comercial Único", "lat": 3.4203, "lng": -76.5468, "type": "mall", "address": "Cra. 38 # 5-01"},
-            {"nombre": "Centro Comercial Chipichape", "lat": 3.4926, "lng": -76.5008, "type": "mall", "address": "Cra. 38 # 53-45"}
-        ],
-        "parque": [
-            {"nombre": "Parque del Perro", "lat": 3.4025, "lng": -76.5456, "type": "park", "address": "Calle 2 Oeste"},
-            {"nombre": "Parque del Gato", "lat": 3.4518, "lng": -76.5321, "type": "park", "address": "Cra. 4 # 10-00"},
-            {"nombre": "Parque de la Caña", "lat": 3.4852, "lng": -76.5051, "type": "park", "address": "Cra. 56 # 3-00"}
-        ],
-        "aeropuerto": [
-            {"nombre": "Aeropuerto Alfonso Bonilla Aragón", "lat": 3.5432, "lng": -76.3815, "type": "airport", "address": "Palmira, Valle del Cauca"}
-        ],
-        "farmacia": [
-            {"nombre": "Farmacia Cruz Verde", "lat": 3.4510, "lng": -76.5320, "type": "pharmacy", "address": "Cra. 4 # 10-25"},
-            {"nombre": "Farmacia Dr. Simi", "lat": 3.4415, "lng": -76.5460, "type": "pharmacy", "address": "Calle 5 # 62-15"}
-        ],
-        "banco": [
-            {"nombre": "Banco de Bogotá", "lat": 3.4515, "lng": -76.5318, "type": "bank", "address": "Cra. 4 # 10-30"},
-            {"nombre": "Bancolombia", "lat": 3.4418, "lng": -76.5458, "type": "bank", "address": "Calle 5 # 62-20"}
-        ]
-    }
+    destination_name_lower = _normalize(destination_name)
+    search_tokens = set(destination_name_lower.split())
     
+    # Una sola pasada: cada lugar recibe el nivel de coincidencia más fuerte
+    # (3 = categoría, 2 = nombre exacto, 1 = palabra en común) y solo se
+    # devuelven los lugares del mejor nivel encontrado, en el orden original.
+    best_score = 0
     matches = []
     
-    # Buscar por categoría
-    for category, places in destinations_db.items():
+    for category, place, name_norm, name_tokens in _BACKUP_ENTRIES:
         if category in destination_name_lower:
-            matches.extend(places)
-    
-    # Búsqueda por nombre exacto
-    if not matches:
-        for category, places in destinations_db.items():
-            for place in places:
-                if destination_name_lower in place['nombre'].lower():
-                    matches.append(place)
-    
-    # Búsqueda parcial
-    if not matches:
-        for category, places in destinations_db.items():
-            for place in places:
-                name_words = place['nombre'].lower().split()
-                search_words = destination_name_lower.split()
-                if any(search_word in ' '.join(name_words) for search_word in search_words):
-                    matches.append(place)
+            score = 3
+        elif destination_name_lower in name_norm:
+            score = 2
+        elif search_tokens & name_tokens:
+            score = 1
+        else:
+            continue
+        
+        if score > best_score:
+            best_score = score
+            matches = [place]
+        elif score == best_score:
+            matches.append(place)
     
     return matches
 
@@ -294,18 +392,21 @@ def find_nearest_destination(origin_lat: float, origin_lng: float,
         if not dest_result.get('success') or not dest_result['matches']:
             return {"success": False, "error": f"No se encontraron {destination_type}"}
         
-        # Encontrar el más cercano
-        origin = (origin_lat, origin_lng)
+        # Encontrar el más cercano (haversine vectorizado sobre todos los candidatos)
+        matches = dest_result['matches']
+        lats = np.array([d['lat'] for d in matches], dtype=float)
+        lngs = np.array([d['lng'] for d in matches], dtype=float)
+        distances = haversine_km(origin_lat, origin_lng, lats, lngs)
+        distances[distances > max_distance_km] = np.inf
+        
         nearest_dest = None
         min_distance = float('inf')
         
-        for destination in dest_result['matches']:
-            dest_point = (destination['lat'], destination['lng'])
-            distance = geodesic(origin, dest_point).kilometers
-            
-            if distance < min_distance and distance <= max_distance_km:
-                min_distance = distance
-                nearest_dest = destination
+        nearest_idx = int(np.argmin(distances))
+        if np.isfinite(distances[nearest_idx]):
+            nearest_dest = matches[nearest_idx]
+            # Distancia exacta (geodésica) solo para el destino elegido
+            min_distance = geodesic((origin_lat, origin_lng), (nearest_dest['lat'], nearest_dest['lng'])).kilometers
         
         if nearest_dest:
             return {
@@ -321,6 +422,31 @@ def find_nearest_destination(origin_lat: float, origin_lng: float,
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# Búsquedas más frecuentes que se pueden precargar en segundo plano al importar el módulo
+COMMON_SEARCH_TERMS = ["hospital", "restaurante", "centro comercial", "parque", "farmacia"]
+
+def _prefetch_search(term: str) -> None:
+    try:
+        cached_destination_by_tags(term, CALI_LOCATION)
+    except Exception as e:
+        logger.debug("Error precargando '%s': %s", term, e)
+
+# El servidor público de Overpass solo admite ~2 consultas simultáneas por IP
+PREFETCH_MAX_WORKERS = 2
+
+def _prefetch_common_searches() -> None:
+    """
+    Calienta la caché de osmnx y la caché en memoria para las búsquedas frecuentes.
+    Las consultas Overpass son independientes; se lanzan en paralelo sin superar
+    el límite de Overpass (si no, responde 429 y osmnx espera ~1 minuto por cada una).
+    """
+    with ThreadPoolExecutor(max_workers=PREFETCH_MAX_WORKERS) as executor:
+        list(executor.map(_prefetch_search, COMMON_SEARCH_TERMS))
+
+# Opcional (OSM_PREFETCH=1): por defecto importar el módulo no genera tráfico de red
+if os.getenv("OSM_PREFETCH", "0") == "1":
+    threading.Thread(target=_prefetch_common_searches, name="osm-prefetch", daemon=True).start()
+
 # Función de compatibilidad con el código existente
 def find_destination(destination_name: str) -> dict:
     """
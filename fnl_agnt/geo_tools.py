@@ -0,0 +1,29 @@
+# geo_tools.py
+import numpy as np
+
+# Radio medio de la Tierra en km (para distancias de gran círculo)
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Distancia de gran círculo en km. Acepta escalares o arreglos de NumPy
+    (con broadcasting), así que calcula muchas distancias en una sola pasada.
+    """
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(value, dtype=float)) for value in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+# Latitud de referencia de la proyección plana local (centro de Cali)
+PROJECTION_REF_LAT = 3.45
+
+def project_km(lats, lngs, ref_lat: float = PROJECTION_REF_LAT):
+    """
+    Proyección equirectangular local: devuelve un arreglo (n, 2) de coordenadas
+    x/y en km. Dentro del área urbana el error frente a haversine es < 0.1 %,
+    así que las distancias pasan a ser euclidianas (np.hypot) sin trigonometría.
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lngs = np.atleast_1d(np.asarray(lngs, dtype=float))
+    x = np.radians(lngs) * EARTH_RADIUS_KM * np.cos(np.radians(ref_lat))
+    y = np.radians(lats) * EARTH_RADIUS_KM
+    return np.column_stack([x, y])
@@ -1,20 +1,155 @@
 # osm_route_tools.py
-import osmnx as ox
 import networkx as nx
-from geopy.distance import geodesic
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+from scipy.sparse.csgraph import dijkstra
 import requests
 import json
+import threading
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from typing import List, Dict, Optional
 from datetime import datetime
 
 # Importar herramientas
 from .air_quality_tools import get_air_quality_for_all_nodes, get_quality_level
-from .destination_tools_osm import find_destination_osm, find_nearest_destination
+from .destination_tools_osm import find_destination_osm, find_nearest_destination, ensure_osm, CALI_LOCATION
+from .geo_tools import project_km
 
-# Configurar OSM
-ox.settings.log_console = False
-ox.settings.use_cache = True
-ox.settings.timeout = 300
+@dataclass
+class CachedGraph:
+    """Estructuras precalculadas del grafo de calles para enrutar sobre él (sin el grafo de NetworkX)."""
+    node_ids: np.ndarray          # índice de fila -> id de nodo OSM
+    node_lats: np.ndarray         # índice de fila -> latitud del nodo
+    node_lngs: np.ndarray         # índice de fila -> longitud del nodo
+    node_xy: np.ndarray           # índice de fila -> coordenadas planas (km), ver geo_tools.project_km
+    matrix: csr_matrix            # matriz de adyacencia dispersa con la longitud (m) de cada arista
+    node_tree: cKDTree            # índice euclidiano de los nodos sobre node_xy
+
+@dataclass
+class RouteCoords:
+    """Coordenadas de la ruta como arreglos paralelos (lat, lng, id de nodo)."""
+    lats: np.ndarray
+    lngs: np.ndarray
+    node_ids: np.ndarray
+    xy: np.ndarray                # coordenadas planas (km) de cada punto, para medir distancias
+    
+    def __len__(self) -> int:
+        return len(self.lats)
+    
+    def point(self, i: int) -> Dict:
+        """Punto i como diccionario serializable; solo se usa al construir la respuesta."""
+        return {'lat': float(self.lats[i]), 'lng': float(self.lngs[i]), 'node_id': int(self.node_ids[i])}
+
+# Grafos de calles ya descargados, por modo de transporte (el área no cambia entre consultas)
+_GRAPH_CACHE: Dict[str, CachedGraph] = {}
+_GRAPH_LOCK = threading.Lock()
+
+def _get_graph(mode: str) -> CachedGraph:
+    """Devuelve el grafo de Cali para el modo dado, descargándolo solo la primera vez."""
+    cached = _GRAPH_CACHE.get(mode)
+    if cached is None:
+        with _GRAPH_LOCK:
+            cached = _GRAPH_CACHE.get(mode)
+            if cached is None:
+                print("🔄 Descargando mapa de Cali desde OpenStreetMap...")
+                graph = ensure_osm().graph_from_place(CALI_LOCATION, network_type=mode)
+                cached = _build_cached_graph(graph)
+                _GRAPH_CACHE[mode] = cached
+    return cached
+
+def _build_cached_graph(graph: nx.MultiDiGraph) -> CachedGraph:
+    """Convierte el grafo a una matriz CSR de longitudes para usar el Dijkstra compilado de SciPy."""
+    node_ids = np.array(list(graph.nodes))
+    node_index = {node_id: i for i, node_id in enumerate(graph.nodes)}
+    
+    edges = [(node_index[u], node_index[v], data.get('length', 0.0)) for u, v, data in graph.edges(data=True)]
+    rows, cols, lengths = (np.array(values) for values in zip(*edges))
+    
+    # En aristas paralelas se conserva solo la más corta
+    order = np.lexsort((lengths, cols, rows))
+    rows, cols, lengths = rows[order], cols[order], lengths[order].astype(float)
+    first = np.ones(len(rows), dtype=bool)
+    first[1:] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    
+    matrix = csr_matrix((lengths[first], (rows[first], cols[first])), shape=(len(node_ids), len(node_ids)))
+    
+    node_latlng = np.fromiter(((data['y'], data['x']) for _, data in graph.nodes(data=True)),
+                              dtype=[('y', 'f8'), ('x', 'f8')], count=len(node_ids))
+    node_lats, node_lngs = node_latlng['y'], node_latlng['x']
+    node_xy = project_km(node_lats, node_lngs)
+    
+    return CachedGraph(node_ids=node_ids, node_lats=node_lats, node_lngs=node_lngs, node_xy=node_xy,
+                       matrix=matrix, node_tree=cKDTree(node_xy))
+
+def _nearest_graph_nodes(cached: CachedGraph, lats: List[float], lngs: List[float]) -> List[int]:
+    """Índices de fila de los nodos más cercanos a varios puntos, en una sola consulta al índice en caché."""
+    _, indices = cached.node_tree.query(project_km(lats, lngs), k=1)
+    return indices.tolist()
+
+# Radio de búsqueda de Dijkstra: múltiplo de la distancia en línea recta entre origen y destino
+ROUTE_SEARCH_DETOUR_FACTOR = 2.0
+ROUTE_SEARCH_MIN_RADIUS_M = 2000.0
+
+def _shortest_path(cached: CachedGraph, origin_idx: int, destination_idx: int):
+    """
+    Ruta más corta por longitud con el Dijkstra de SciPy (implementado en C).
+    La búsqueda se acota primero a un radio proporcional a la distancia en línea recta
+    (cota inferior de cualquier ruta por calles); solo si el destino queda fuera se
+    repite sin límite. Recibe y devuelve índices de fila: (arreglo de índices, longitud total en metros).
+    """
+    straight_line_m = float(np.hypot(*(cached.node_xy[destination_idx] - cached.node_xy[origin_idx]))) * 1000
+    search_limit = max(straight_line_m * ROUTE_SEARCH_DETOUR_FACTOR, ROUTE_SEARCH_MIN_RADIUS_M)
+    
+    distances, predecessors = dijkstra(cached.matrix, directed=True, indices=origin_idx,
+                                       return_predecessors=True, limit=search_limit)
+    if not np.isfinite(distances[destination_idx]):
+        distances, predecessors = dijkstra(cached.matrix, directed=True, indices=origin_idx,
+                                           return_predecessors=True)
+    if not np.isfinite(distances[destination_idx]):
+        raise nx.NetworkXNoPath(
+            f"No hay ruta entre {cached.node_ids[origin_idx]} y {cached.node_ids[destination_idx]}"
+        )
+    
+    path = [destination_idx]
+    while path[-1] != origin_idx:
+        path.append(predecessors[path[-1]])
+    path.reverse()
+    
+    return np.array(path), float(distances[destination_idx])
+
+# Número de puntos de la ruta en los que se evalúa la calidad del aire
+ROUTE_AIR_QUALITY_SAMPLES = 10
+
+# Índice espacial de sensores: (lista de nodos indexada, KD-tree sobre sus coordenadas planas en km)
+_SENSOR_INDEX = (None, None)
+
+def _get_sensor_tree(air_quality_nodes: List[Dict]) -> cKDTree:
+    """Construye el KD-tree de sensores una sola vez por lista de nodos."""
+    global _SENSOR_INDEX
+    indexed_nodes, tree = _SENSOR_INDEX
+    if indexed_nodes is not air_quality_nodes:
+        tree = cKDTree(project_km([node['lat'] for node in air_quality_nodes],
+                                  [node['lng'] for node in air_quality_nodes]))
+        _SENSOR_INDEX = (air_quality_nodes, tree)
+    return tree
+
+def _nearest_sensors(lats, lngs, air_quality_nodes: List[Dict], max_distance_km: float = 3.0):
+    """
+    Busca el sensor más cercano a cada punto en una sola consulta vectorizada.
+    Devuelve (índices, distancias_km); el índice es -1 si no hay sensor dentro de max_distance_km.
+    """
+    lats = np.atleast_1d(np.asarray(lats, dtype=float))
+    lngs = np.atleast_1d(np.asarray(lngs, dtype=float))
+    if not air_quality_nodes:
+        return np.full(len(lats), -1), np.full(len(lats), np.inf)
+    
+    tree = _get_sensor_tree(air_quality_nodes)
+    distances_km, indices = tree.query(project_km(lats, lngs), k=1)
+    indices = np.where(distances_km <= max_distance_km, indices, -1)
+    return indices, distances_km
 
 def get_osm_route_with_air_quality(origin_lat: float, origin_lng: float,
                                   destination_lat: float, destination_lng: float,
@@ -23,50 +158,48 @@ def get_osm_route_with_air_quality(origin_lat: float, origin_lng: float,
     Genera ruta REAL usando OpenStreetMap con análisis de calidad del aire.
     """
     try:
-        print("🔄 Descargando mapa de Cali desde OpenStreetMap...")
-        
-        # 1. Obtener grafo de calles de Cali
-        graph = ox.graph_from_place("Cali, Colombia", network_type=mode)
+        # 1. Obtener grafo de calles de Cali (en caché tras la primera descarga) y, en
+        #    paralelo, la calidad del aire: son dos descargas independientes
+        print("🔄 Analizando calidad del aire...")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            graph_future = executor.submit(_get_graph, mode)
+            air_quality_future = executor.submit(get_air_quality_for_all_nodes)
+            cached_graph = graph_future.result()
+            air_quality_data = air_quality_future.result()
         
-        # 2. Encontrar nodos más cercanos en el grafo
-        origin_node = ox.distance.nearest_nodes(graph, origin_lng, origin_lat)
-        destination_node = ox.distance.nearest_nodes(graph, destination_lng, destination_lat)
+        # 2. Encontrar nodos más cercanos en el grafo (origen y destino en una sola consulta)
+        origin_idx, destination_idx = _nearest_graph_nodes(
+            cached_graph, [origin_lat, destination_lat], [origin_lng, destination_lng]
+        )
         
-        # 3. Calcular ruta más corta
+        # 3. Calcular ruta más corta (y su longitud total en metros)
         print("🔄 Calculando ruta óptima...")
-        route = nx.shortest_path(graph, origin_node, destination_node, weight='length')
-        
-        # 4. Obtener coordenadas detalladas de la ruta
-        route_coords = []
-        
-        for i in range(len(route)):
-            node_data = graph.nodes[route[i]]
-            route_coords.append({
-                'lat': node_data['y'],
-                'lng': node_data['x'],
-                'node_id': route[i]
-            })
+        route_idx, route_length_m = _shortest_path(cached_graph, origin_idx, destination_idx)
         
-        # 5. Calcular distancia total
-        route_length_m = 0
-        for i in range(len(route) - 1):
-            node_from = route[i]
-            node_to = route[i + 1]
-            edge_data = graph.get_edge_data(node_from, node_to)
-            if edge_data:
-                route_length_m += list(edge_data.values())[0].get('length', 0)
+        # 4. Obtener coordenadas detalladas de la ruta (lectura directa de los arreglos del grafo)
+        route_coords = RouteCoords(
+            lats=cached_graph.node_lats[route_idx],
+            lngs=cached_graph.node_lngs[route_idx],
+            node_ids=cached_graph.node_ids[route_idx],
+            xy=cached_graph.node_xy[route_idx]
+        )
         
+        # 5. Distancia total (ya calculada por Dijkstra)
         route_length_km = route_length_m / 1000
         
-        # 6. Obtener calidad del aire
-        print("🔄 Analizando calidad del aire...")
-        air_quality_data = get_air_quality_for_all_nodes()
+        # 6. Calidad del aire en los puntos de los pasos y de las muestras, en una sola consulta
+        point_air_quality = compute_point_air_quality_batch(
+            route_coords,
+            np.concatenate([route_step_indices(len(route_coords)), route_sample_indices(route_coords)]),
+            air_quality_data
+        )
         
         # 7. Generar instrucciones paso a paso
-        steps = generate_detailed_route_steps(route_coords, air_quality_data, mode, route_length_km)
+        steps = generate_detailed_route_steps(route_coords, air_quality_data, mode, route_length_km,
+                                              point_air_quality)
         
         # 8. Análisis de calidad del aire en la ruta
-        route_air_quality = analyze_route_air_quality(route_coords, air_quality_data)
+        route_air_quality = analyze_route_air_quality(route_coords, air_quality_data, point_air_quality)
         
         return {
             "success": True,
@@ -78,11 +211,14 @@ def get_osm_route_with_air_quality(origin_lat: float, origin_lng: float,
                 "total_distance_m": round(route_length_m, 2),
                 "estimated_duration_min": round(calculate_osm_duration(route_length_km, mode), 1),
                 "transport_mode": get_mode_display_name(mode),
-                "nodes_in_route": len(route),
+                "nodes_in_route": len(route_idx),
                 "coordinates_count": len(route_coords)
             },
             "step_by_step_instructions": steps,
-            "route_coordinates": [{"lat": coord['lat'], "lng": coord['lng']} for coord in route_coords],
+            "route_coordinates": [
+                {"lat": lat, "lng": lng}
+                for lat, lng in zip(route_coords.lats.tolist(), route_coords.lngs.tolist())
+            ],
             "air_quality_analysis": route_air_quality,
             "map_data": {
                 "bounds": calculate_osm_bounds(route_coords),
@@ -96,73 +232,79 @@ def get_osm_route_with_air_quality(origin_lat: float, origin_lng: float,
     except Exception as e:
         return {"success": False, "error": f"Error en cálculo de ruta: {str(e)}"}
 
-def generate_detailed_route_steps(route_coords: List[Dict], air_quality_data: dict, 
-                                mode: str, total_distance_km: float) -> List[Dict]:
+def generate_detailed_route_steps(route_coords: RouteCoords, air_quality_data: dict, 
+                                mode: str, total_distance_km: float,
+                                point_air_quality: Optional[Dict[int, Dict]] = None) -> List[Dict]:
     """
     Genera instrucciones detalladas paso a paso para la ruta.
+    point_air_quality permite reutilizar la calidad del aire ya calculada por índice de punto.
     """
     if len(route_coords) < 3:
-        return generate_basic_steps(route_coords, air_quality_data, mode, total_distance_km)
+        return generate_basic_steps(route_coords, air_quality_data, mode, total_distance_km, point_air_quality)
+    
+    step_indices = route_step_indices(len(route_coords))
+    if point_air_quality is None:
+        point_air_quality = compute_point_air_quality_batch(route_coords, step_indices, air_quality_data)
+    
+    # Valores que dependen solo del modo: se calculan una vez, fuera del bucle
+    speed_kmh = get_osm_speed_kmh(mode)
+    mode_name = get_mode_display_name(mode)
+    
+    # Distancias en línea recta desde el inicio a todos los pasos, en una sola pasada
+    step_distances_km = route_distances_from_start(route_coords, step_indices).tolist()
     
     steps = []
+    start_point = route_coords.point(0)
     
     # Paso 1: Inicio
     steps.append({
         "step_number": 1,
         "instruction": "📍 Inicie su viaje desde el punto de origen",
-        "coordinates": route_coords[0],
+        "coordinates": start_point,
         "distance_from_start_km": 0.0,
         "estimated_time_min": 0.0,
-        "air_quality": evaluate_point_air_quality(route_coords[0], air_quality_data),
+        "air_quality": point_air_quality[0],
         "icon": "📍",
         "type": "start"
     })
     
-    # Dividir la ruta en segmentos significativos
-    num_segments = min(8, max(3, len(route_coords) // 10))
-    segment_size = len(route_coords) // num_segments
-    
-    for segment_idx in range(1, num_segments):
-        point_idx = segment_idx * segment_size
-        if point_idx >= len(route_coords):
-            break
-            
-        current_point = route_coords[point_idx]
-        distance_from_start = calculate_distance_along_route(route_coords[0], current_point)
+    # Pasos intermedios en los segmentos significativos de la ruta
+    for segment_idx, point_idx in enumerate(step_indices[1:-1], start=1):
+        current_point = route_coords.point(point_idx)
+        distance_from_start = step_distances_km[segment_idx]
         
         # Generar instrucción basada en el progreso
         progress = point_idx / len(route_coords)
-        instruction = generate_segment_instruction(segment_idx, progress, mode)
+        instruction = generate_segment_instruction(segment_idx, progress, mode_name)
         
         steps.append({
             "step_number": len(steps) + 1,
             "instruction": instruction,
             "coordinates": current_point,
             "distance_from_start_km": round(distance_from_start, 2),
-            "estimated_time_min": round(distance_from_start / get_osm_speed_kmh(mode) * 60, 1),
-            "air_quality": evaluate_point_air_quality(current_point, air_quality_data),
+            "estimated_time_min": round(distance_from_start / speed_kmh * 60, 1),
+            "air_quality": point_air_quality[point_idx],
             "icon": get_segment_icon(segment_idx),
             "type": "navigation"
         })
     
     # Paso final: Llegada
+    end_idx = len(route_coords) - 1
     steps.append({
         "step_number": len(steps) + 1,
         "instruction": "🎯 Ha llegado a su destino",
-        "coordinates": route_coords[-1],
+        "coordinates": route_coords.point(end_idx),
         "distance_from_start_km": round(total_distance_km, 2),
-        "estimated_time_min": round(total_distance_km / get_osm_speed_kmh(mode) * 60, 1),
-        "air_quality": evaluate_point_air_quality(route_coords[-1], air_quality_data),
+        "estimated_time_min": round(total_distance_km / speed_kmh * 60, 1),
+        "air_quality": point_air_quality[end_idx],
         "icon": "🎯",
         "type": "arrival"
     })
     
     return steps
 
-def generate_segment_instruction(segment_idx: int, progress: float, mode: str) -> str:
-    """Genera instrucciones contextuales basadas en el progreso."""
-    mode_name = get_mode_display_name(mode)
-    
+def generate_segment_instruction(segment_idx: int, progress: float, mode_name: str) -> str:
+    """Genera instrucciones contextuales basadas en el progreso (mode_name: ver get_mode_display_name)."""
     if progress < 0.3:
         return f"⬆️ Continúe por la ruta principal en {mode_name}"
     elif progress < 0.6:
@@ -177,7 +319,8 @@ def get_segment_icon(segment_idx: int) -> str:
     icons = ["⬆️", "➡️", "↗️", "🔷", "🔶", "🚦", "🛣️", "🎯"]
     return icons[segment_idx % len(icons)]
 
-def analyze_route_air_quality(route_coords: List[Dict], air_quality_data: dict) -> Dict:
+def analyze_route_air_quality(route_coords: RouteCoords, air_quality_data: dict,
+                              point_air_quality: Optional[Dict[int, Dict]] = None) -> Dict:
     """Analiza la calidad del aire a lo largo de toda la ruta."""
     if not air_quality_data.get('success'):
         return {
@@ -195,34 +338,33 @@ def analyze_route_air_quality(route_coords: List[Dict], air_quality_data: dict)
             "message": "No se encontraron sensores de calidad del aire"
         }
     
-    # Muestrear puntos a lo largo de la ruta
-    sample_indices = range(0, len(route_coords), max(1, len(route_coords) // 10))
-    sample_points = [route_coords[i] for i in sample_indices if i < len(route_coords)]
-    
-    scores = []
-    quality_points = []
-    
-    for point in sample_points:
-        nearest_node = find_nearest_air_quality_node(point['lat'], point['lng'], air_quality_nodes)
-        if nearest_node:
-            score = nearest_node['air_quality']['air_quality_score']
-            scores.append(score)
-            quality_points.append({
-                "coordinates": point,
-                "score": score,
-                "quality_level": get_quality_level(score),
-                "nearest_sensor": nearest_node['nombre']
-            })
-    
-    if scores:
-        avg_score = sum(scores) / len(scores)
+    # Muestrear puntos a lo largo de la ruta (espaciados por distancia, no por número de nodos)
+    sample_indices = route_sample_indices(route_coords)
+    if point_air_quality is None:
+        point_air_quality = compute_point_air_quality_batch(route_coords, sample_indices, air_quality_data)
+    
+    # Solo cuentan los puntos con un sensor dentro del radio de búsqueda
+    covered = [point_idx for point_idx in sample_indices.tolist() if "nearest_sensor" in point_air_quality[point_idx]]
+    
+    if covered:
+        scores = np.array([point_air_quality[point_idx]['score'] for point_idx in covered], dtype=float)
+        avg_score = float(scores.mean())
+        quality_points = [
+            {
+                "coordinates": route_coords.point(point_idx),
+                "score": point_air_quality[point_idx]['score'],
+                "quality_level": point_air_quality[point_idx]['level'],
+                "nearest_sensor": point_air_quality[point_idx]['nearest_sensor']
+            }
+            for point_idx in covered[:3]
+        ]
         return {
             "average_air_quality_score": round(avg_score, 2),
             "quality_level": get_quality_level(avg_score),
             "samples_analyzed": len(scores),
-            "min_score": round(min(scores), 2),
-            "max_score": round(max(scores), 2),
-            "quality_points": quality_points[:3],
+            "min_score": round(float(scores.min()), 2),
+            "max_score": round(float(scores.max()), 2),
+            "quality_points": quality_points,
             "recommendation": generate_air_quality_recommendation(avg_score)
         }
     else:
@@ -245,19 +387,8 @@ def generate_air_quality_recommendation(score: float) -> str:
 
 def find_nearest_air_quality_node(lat: float, lng: float, air_quality_nodes: List[Dict], max_distance_km: float = 3.0) -> Optional[Dict]:
     """Encuentra el nodo de calidad del aire más cercano."""
-    point = (lat, lng)
-    nearest = None
-    min_distance = float('inf')
-    
-    for node in air_quality_nodes:
-        node_point = (node['lat'], node['lng'])
-        distance = geodesic(point, node_point).kilometers
-        
-        if distance < min_distance and distance <= max_distance_km:
-            min_distance = distance
-            nearest = node
-    
-    return nearest
+    indices, _ = _nearest_sensors(lat, lng, air_quality_nodes, max_distance_km)
+    return air_quality_nodes[indices[0]] if indices[0] >= 0 else None
 
 def evaluate_point_air_quality(point: Dict, air_quality_data: dict) -> Dict:
     """Evalúa la calidad del aire en un punto específico."""
@@ -265,21 +396,42 @@ def evaluate_point_air_quality(point: Dict, air_quality_data: dict) -> Dict:
         return {"score": 50.0, "level": "🔵 Sin datos"}
     
     air_quality_nodes = air_quality_data.get('nodes_with_air_quality', [])
-    nearest = find_nearest_air_quality_node(point['lat'], point['lng'], air_quality_nodes)
+    indices, distances_km = _nearest_sensors(point['lat'], point['lng'], air_quality_nodes)
+    return _point_air_quality(air_quality_nodes, int(indices[0]), float(distances_km[0]))
+
+def compute_point_air_quality_batch(route_coords: RouteCoords, indices, air_quality_data: dict) -> Dict[int, Dict]:
+    """
+    Evalúa la calidad del aire en varios puntos de la ruta con una sola consulta al índice
+    de sensores. Devuelve {índice de punto: resultado de evaluate_point_air_quality}.
+    """
+    indices = np.unique(np.asarray(indices, dtype=int)).tolist()
+    if not air_quality_data.get('success'):
+        return {point_idx: {"score": 50.0, "level": "🔵 Sin datos"} for point_idx in indices}
     
-    if nearest:
-        score = nearest['air_quality']['air_quality_score']
-        return {
-            "score": score,
-            "level": get_quality_level(score),
-            "nearest_sensor": nearest['nombre'],
-            "sensor_distance_km": round(geodesic((point['lat'], point['lng']), 
-                                               (nearest['lat'], nearest['lng'])).kilometers, 2)
-        }
-    else:
+    air_quality_nodes = air_quality_data.get('nodes_with_air_quality', [])
+    sensor_indices, distances_km = _nearest_sensors(
+        route_coords.lats[indices], route_coords.lngs[indices], air_quality_nodes
+    )
+    return {
+        point_idx: _point_air_quality(air_quality_nodes, sensor_idx, distance_km)
+        for point_idx, sensor_idx, distance_km in zip(indices, sensor_indices.tolist(), distances_km.tolist())
+    }
+
+def _point_air_quality(air_quality_nodes: List[Dict], sensor_idx: int, distance_km: float) -> Dict:
+    if sensor_idx < 0:
         return {"score": 50.0, "level": "🔵 Sin datos cercanos"}
+    
+    nearest = air_quality_nodes[sensor_idx]
+    score = nearest['air_quality']['air_quality_score']
+    return {
+        "score": score,
+        "level": get_quality_level(score),
+        "nearest_sensor": nearest['nombre'],
+        "sensor_distance_km": round(distance_km, 2)
+    }
 
 # Funciones de apoyo
+@functools.lru_cache(maxsize=8)
 def get_osm_speed_kmh(mode: str) -> float:
     speeds = {"drive": 40.0, "walk": 5.0, "bike": 15.0}
     return speeds.get(mode, 20.0)
@@ -287,46 +439,79 @@ def get_osm_speed_kmh(mode: str) -> float:
 def calculate_osm_duration(distance_km: float, mode: str) -> float:
     return (distance_km / get_osm_speed_kmh(mode)) * 60
 
-def calculate_osm_bounds(route_coords: List[Dict]) -> Dict:
-    lats = [p['lat'] for p in route_coords]
-    lngs = [p['lng'] for p in route_coords]
+def calculate_osm_bounds(route_coords: RouteCoords) -> Dict:
     return {
-        "north": max(lats),
-        "south": min(lats), 
-        "east": max(lngs),
-        "west": min(lngs)
+        "north": float(route_coords.lats.max()),
+        "south": float(route_coords.lats.min()),
+        "east": float(route_coords.lngs.max()),
+        "west": float(route_coords.lngs.min())
     }
 
-def find_route_center(route_coords: List[Dict]) -> Dict:
+def find_route_center(route_coords: RouteCoords) -> Dict:
     mid_idx = len(route_coords) // 2
-    return {"lat": route_coords[mid_idx]['lat'], "lng": route_coords[mid_idx]['lng']}
+    return {"lat": float(route_coords.lats[mid_idx]), "lng": float(route_coords.lngs[mid_idx])}
 
 def calculate_distance_along_route(start_point: Dict, current_point: Dict) -> float:
-    return geodesic((start_point['lat'], start_point['lng']), 
-                   (current_point['lat'], current_point['lng'])).kilometers
+    xy = project_km([start_point['lat'], current_point['lat']], [start_point['lng'], current_point['lng']])
+    return float(np.hypot(*(xy[1] - xy[0])))
+
+def route_distances_from_start(route_coords: RouteCoords, indices) -> np.ndarray:
+    """Distancia en línea recta (km) desde el inicio de la ruta a varios de sus puntos."""
+    return np.hypot(*(route_coords.xy[indices] - route_coords.xy[0]).T)
 
+def route_step_indices(num_points: int) -> List[int]:
+    """Índices de los puntos de la ruta usados como pasos: inicio, segmentos intermedios y llegada."""
+    if num_points < 3:
+        return [0, num_points - 1]
+    
+    # Dividir la ruta en segmentos significativos
+    num_segments = min(8, max(3, num_points // 10))
+    segment_size = num_points // num_segments
+    return [0] + [segment_idx * segment_size for segment_idx in range(1, num_segments)] + [num_points - 1]
+
+def route_sample_indices(route_coords: RouteCoords, num_samples: int = ROUTE_AIR_QUALITY_SAMPLES) -> np.ndarray:
+    """
+    Índices de num_samples puntos repartidos uniformemente por distancia recorrida.
+    Los tramos con muchos nodos agrupados ya no acaparan las muestras.
+    """
+    if len(route_coords) <= num_samples:
+        return np.arange(len(route_coords))
+    
+    segment_km = np.hypot(*np.diff(route_coords.xy, axis=0).T)
+    cumulative_km = np.concatenate([[0.0], np.cumsum(segment_km)])
+    targets_km = np.linspace(0.0, cumulative_km[-1], num_samples, endpoint=False)
+    return np.unique(np.searchsorted(cumulative_km, targets_km))
+
+@functools.lru_cache(maxsize=8)
 def get_mode_display_name(mode: str) -> str:
     names = {"drive": "vehículo", "walk": "caminando", "bike": "bicicleta"}
     return names.get(mode, mode)
 
-def generate_basic_steps(route_coords: List[Dict], air_quality_data: dict, mode: str, total_distance_km: float) -> List[Dict]:
+def generate_basic_steps(route_coords: RouteCoords, air_quality_data: dict, mode: str, total_distance_km: float,
+                         point_air_quality: Optional[Dict[int, Dict]] = None) -> List[Dict]:
     """Genera pasos básicos cuando la ruta es muy corta."""
+    mid_idx = len(route_coords) // 2
+    end_idx = len(route_coords) - 1
+    if point_air_quality is None:
+        point_air_quality = compute_point_air_quality_batch(route_coords, [0, mid_idx, end_idx], air_quality_data)
+    
     steps = []
+    start_point = route_coords.point(0)
     
     steps.append({
         "step_number": 1,
         "instruction": "📍 Inicio del viaje",
-        "coordinates": route_coords[0],
+        "coordinates": start_point,
         "distance_from_start_km": 0.0,
         "estimated_time_min": 0.0,
-        "air_quality": evaluate_point_air_quality(route_coords[0], air_quality_data),
+        "air_quality": point_air_quality[0],
         "icon": "📍",
         "type": "start"
     })
     
     if len(route_coords) > 2:
-        mid_point = route_coords[len(route_coords)//2]
-        mid_distance = calculate_distance_along_route(route_coords[0], mid_point)
+        mid_point = route_coords.point(mid_idx)
+        mid_distance = float(route_distances_from_start(route_coords, [mid_idx])[0])
         
         steps.append({
             "step_number": 2,
@@ -334,7 +519,7 @@ def generate_basic_steps(route_coords: List[Dict], air_quality_data: dict, mode:
             "coordinates": mid_point,
             "distance_from_start_km": round(mid_distance, 2),
             "estimated_time_min": round(mid_distance / get_osm_speed_kmh(mode) * 60, 1),
-            "air_quality": evaluate_point_air_quality(mid_point, air_quality_data),
+            "air_quality": point_air_quality[mid_idx],
             "icon": "🎯",
             "type": "navigation"
         })
@@ -342,10 +527,10 @@ def generate_basic_steps(route_coords: List[Dict], air_quality_data: dict, mode:
     steps.append({
         "step_number": len(steps) + 1,
         "instruction": "✅ Ha llegado a su destino",
-        "coordinates": route_coords[-1],
+        "coordinates": route_coords.point(end_idx),
         "distance_from_start_km": round(total_distance_km, 2),
         "estimated_time_min": round(total_distance_km / get_osm_speed_kmh(mode) * 60, 1),
-        "air_quality": evaluate_point_air_quality(route_coords[-1], air_quality_data),
+        "air_quality": point_air_quality[end_idx],
         "icon": "✅",
         "type": "arrival"
     })